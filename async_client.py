@@ -0,0 +1,145 @@
+import asyncio
+import threading
+from collections import OrderedDict
+
+from config_manager import ConfigManager
+from markergen import (RuntimeConfig, parse_url, get_fight_data, fetch_fight_events, process_cast_events,
+                       process_untargetable_events, build_user_config, generate_final_json)
+
+
+class FFLogsAsyncClient:
+    """
+    供其他服务以库的形式调用的 asyncio 客户端。
+    所有调用共用一个连接池（各工作线程各自的 requests.Session 挂载同一个 HTTPAdapter）和一份战斗数据缓存；
+    同一场战斗的并发请求只会触发一次下载 (single-flight)。
+    与 fetch_log_data 不同，这里出错直接抛出异常，不返回错误字符串。
+    """
+
+    def __init__(self, api_key, translate=False, max_concurrency=8, max_cached_fights=32):
+        from requests.adapters import HTTPAdapter
+
+        self.api_key = api_key
+        self.translate = translate
+        self.max_cached_fights = max_cached_fights
+
+        # requests.Session 本身不保证线程安全，每个工作线程使用自己的 Session；
+        # HTTPAdapter 底层的 urllib3 连接池是线程安全的，由所有 Session 共享
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self._local = threading.local()
+        self._sessions = []
+        self._sessions_lock = threading.Lock()
+
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._inflight = {}
+        self._cache = OrderedDict()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        await asyncio.to_thread(self._close_sessions)
+
+    def _close_sessions(self):
+        with self._sessions_lock:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            session.close()
+        self._adapter.close()
+
+    def _get_session(self):
+        """在工作线程中调用，返回当前线程专用的 Session"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            import requests
+
+            session = requests.Session()
+            session.mount("https://", self._adapter)
+            self._local.session = session
+            with self._sessions_lock:
+                self._sessions.append(session)
+        return session
+
+    def _resolve_in_thread(self, config):
+        return get_fight_data(config, self._get_session())
+
+    def _fetch_in_thread(self, config):
+        return fetch_fight_events(config, self._get_session())
+
+    def _cache_get(self, key):
+        fight_events = self._cache.get(key)
+        if fight_events is not None:
+            self._cache.move_to_end(key)
+        return fight_events
+
+    def _cache_put(self, key, fight_events):
+        self._cache[key] = fight_events
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_cached_fights:
+            self._cache.popitem(last=False)
+
+    async def _download(self, config):
+        async with self._semaphore:
+            fight_events = await asyncio.to_thread(self._fetch_in_thread, config)
+
+        if fight_events is None:
+            raise LookupError(f"在报告 {config.logs_id} 中未找到 Fight ID: {config.fight_id}")
+
+        self._cache_put((config.logs_id, fight_events.fight.fight_id, self.translate), fight_events)
+        return fight_events
+
+    async def fetch_fight(self, logs_url):
+        """下载（或从缓存读取）一场战斗的原始事件，返回 FightEvents"""
+        logs_id, fight_id = parse_url(logs_url)
+
+        # "last" 会随直播日志变化，先解析出真实的 fight id（只读战斗列表，有元数据缓存），
+        # 缓存与 single-flight 都按真实 id 进行，与直接指定该 id 的请求共用同一份下载
+        if fight_id == "last":
+            config = RuntimeConfig(logs_id, fight_id, self.api_key, translate=self.translate)
+            async with self._semaphore:
+                fight = await asyncio.to_thread(self._resolve_in_thread, config)
+            if fight is None:
+                raise LookupError(f"在报告 {logs_id} 中未找到 Fight ID: {fight_id}")
+            fight_id = fight.fight_id
+
+        key = (logs_id, fight_id, self.translate)
+
+        fight_events = self._cache_get(key)
+        if fight_events is not None:
+            return fight_events
+
+        task = self._inflight.get(key)
+        if task is None:
+            config = RuntimeConfig(logs_id, fight_id, self.api_key, translate=self.translate)
+            task = asyncio.ensure_future(self._download(config))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        # shield：某个调用方被取消时不影响其他等待同一下载的调用方
+        return await asyncio.shield(task)
+
+    async def generate_timeline(self, logs_url, user_config=None):
+        """
+        生成 MarkerTracksCombined 时间轴
+        :param user_config: 同 generate_final_json；为 None 时使用该区域已保存的配置
+        """
+        fight_events = await self.fetch_fight(logs_url)
+        return await asyncio.to_thread(_build_timeline, fight_events, user_config)
+
+
+def _build_timeline(fight_events, user_config):
+    # 读取配置文件是阻塞 IO，也可能抛出异常，放在工作线程中进行
+    all_config = ConfigManager.load_all_config()
+    fight = fight_events.fight
+    rules = all_config.get(str(fight.zone_id), {}).get('rules', {})
+    cast_list = process_cast_events(fight_events.cast_events, fight_events.time_offset, rules)
+    untarget_list = process_untargetable_events(fight_events.summary_events, fight_events.overkill_events,
+                                                fight, fight_events.time_offset)
+
+    if user_config is None:
+        skill_names = set(marker.desc for marker in cast_list)
+        user_config = build_user_config(all_config, fight.zone_id, skill_names)
+
+    return generate_final_json(cast_list, untarget_list, user_config)
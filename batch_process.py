@@ -0,0 +1,101 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from config_manager import ConfigManager
+from event_archive import EventArchive, dump_archive
+from markergen import FightEvents, build_user_config, generate_final_json
+
+# 多进程批量后处理：进程间只传存档路径或紧凑的二进制存档（见 event_archive），
+# 而不是带 raw 字典的 Marker 对象；子进程返回的是最终 JSON
+
+
+def _open_item(item):
+    if isinstance(item, str):
+        return EventArchive.open(item)
+    return EventArchive(item)
+
+
+def process_item(item, all_config):
+    """处理单个存档（路径或字节串），返回 (zone_id, zone_name, result_json)"""
+    with _open_item(item) as archive:
+        fight = archive.fight
+        rules = all_config.get(str(fight.zone_id), {}).get('rules', {})
+        cast_list = archive.cast_source(rules)
+        untarget_list = archive.untargetable_list()
+
+    skill_names = set(marker.desc for marker in cast_list)
+    user_config = build_user_config(all_config, fight.zone_id, skill_names)
+    return fight.zone_id, fight.zone_name, generate_final_json(cast_list, untarget_list, user_config)
+
+
+def _process_task(args):
+    return process_item(*args)
+
+
+def regenerate(items, max_workers=None, all_config=None):
+    """
+    在进程池中并行处理多场战斗
+    :param items: 存档路径 / 存档字节串 / FightEvents 的列表
+    :param max_workers: 进程数，None 或 1 以下表示 os.cpu_count()
+    :param all_config: 完整配置字典，默认从 ConfigManager 读取
+    :return: 与 items 顺序一致的 (zone_id, zone_name, result_json) 列表
+    """
+    if all_config is None:
+        all_config = ConfigManager.load_all_config()
+
+    tasks = []
+    for item in items:
+        if isinstance(item, FightEvents):
+            item = dump_archive(item)
+        tasks.append((item, all_config))
+
+    if max_workers is None or max_workers < 1:
+        max_workers = os.cpu_count() or 1
+
+    if max_workers == 1 or len(tasks) <= 1:
+        return [_process_task(task) for task in tasks]
+
+    chunksize = max(1, len(tasks) // (max_workers * 4))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(_process_task, tasks, chunksize=chunksize))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量从事件存档重新生成时间轴")
+    parser.add_argument("archives", nargs="+", help="事件存档文件")
+    parser.add_argument("-o", "--output-dir", help="输出目录，不指定则只处理不写文件")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="进程数，默认 CPU 核数")
+    parser.add_argument("--bench", action="store_true", help="额外单进程运行一次并报告加速比")
+    args = parser.parse_args()
+
+    all_config = ConfigManager.load_all_config()
+
+    start = time.perf_counter()
+    results = regenerate(args.archives, args.workers, all_config)
+    parallel_time = time.perf_counter() - start
+    workers = args.workers if args.workers and args.workers > 0 else (os.cpu_count() or 1)
+    print(f"{len(results)} 场战斗, {workers} 进程: {parallel_time:.3f}s")
+
+    if args.bench:
+        start = time.perf_counter()
+        regenerate(args.archives, 1, all_config)
+        serial_time = time.perf_counter() - start
+        print(f"单进程: {serial_time:.3f}s, 加速比: {serial_time / parallel_time:.2f}x")
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+        for path, (_, _, result_json) in zip(args.archives, results):
+            name = os.path.splitext(os.path.basename(path))[0]
+            out_path = os.path.join(args.output_dir, f"{name}.json")
+            with open(out_path, 'w', encoding='utf-8') as f:
+                json.dump(result_json, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    # PyInstaller 打包后在 Windows 上使用多进程需要
+    multiprocessing.freeze_support()
+    main()
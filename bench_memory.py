@@ -0,0 +1,102 @@
+import argparse
+import json
+import random
+import subprocess
+import sys
+import tracemalloc
+
+from markergen import Fight, UNTARGETABLE_RESOLVE_WINDOW, iter_cast_markers, iter_untargetable_markers
+
+# 流式提取的内存基准：用按需生成的模拟事件驱动 iter_cast_markers / iter_untargetable_markers，
+# 只计数不保存结果。每个规模、每种模式在独立子进程中运行，以得到各自的峰值 RSS。
+# 不可选中区间分两种模式：window（默认的 UNTARGETABLE_RESOLVE_WINDOW，峰值内存应与报告时长无关）
+# 与 exact（resolve_window=None，即 get_untargetable_list 使用的精确模式；死亡的小怪只有 overkill 事件，
+# 其分块要到战斗结束才定案，之后的事件会一直缓存，峰值随报告时长增长）
+
+SKILL_NAMES = [f"技能{i}" for i in range(40)]
+MODES = {'window': UNTARGETABLE_RESOLVE_WINDOW, 'exact': None}
+
+
+def synthetic_cast_events(duration_ms, seed=0):
+    rng = random.Random(seed)
+    t = 0
+    while t < duration_ms:
+        t += rng.choice([0, 50, 300, 1000, 2500])
+        name = rng.choice(SKILL_NAMES)
+        source_instance = rng.randint(0, 3)
+        cast_time = rng.choice([0, 200, 700, 3000])
+        if cast_time:
+            yield {'timestamp': t, 'type': 'begincast', 'sourceInstance': source_instance,
+                   'duration': cast_time, 'ability': {'name': name}}
+        yield {'timestamp': t + cast_time, 'type': 'cast', 'sourceInstance': source_instance,
+               'ability': {'name': name}}
+
+
+def synthetic_summary_events(duration_ms, seed=0):
+    rng = random.Random(seed + 1)
+    t = 0
+    while t < duration_ms:
+        t += rng.randint(5000, 40000)
+        yield {'timestamp': t, 'targetable': rng.choice([0, 1]), 'sourceID': rng.randint(1, 6), 'targetID': 0}
+
+
+def synthetic_overkill_events(duration_ms, seed=0):
+    rng = random.Random(seed + 2)
+    t = 0
+    dead_add_id = 100
+    while t < duration_ms:
+        t += rng.randint(20000, 120000)
+        if rng.random() < 0.5:
+            yield {'timestamp': t, 'targetID': rng.randint(1, 6)}
+        else:
+            # 被击杀后不再出现的小怪：只有一条 overkill 事件
+            dead_add_id += 1
+            yield {'timestamp': t, 'targetID': dead_add_id}
+
+
+def measure(duration_ms, mode):
+    fight = Fight(0, duration_ms, 1)
+
+    tracemalloc.start()
+    cast_count = sum(1 for _ in iter_cast_markers(synthetic_cast_events(duration_ms), 0))
+    untarget_count = sum(1 for _ in iter_untargetable_markers(
+        synthetic_summary_events(duration_ms), synthetic_overkill_events(duration_ms), fight, 0,
+        resolve_window=MODES[mode]))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    try:
+        import resource
+        # Linux 上单位为 KB
+        max_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except ImportError:
+        max_rss_kb = None
+
+    return {'cast_markers': cast_count, 'untarget_markers': untarget_count,
+            'traced_peak_kb': peak // 1024, 'max_rss_kb': max_rss_kb}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流式提取的内存基准")
+    parser.add_argument("hours", nargs="*", type=float, default=[0.25, 1, 4, 16], help="模拟的报告时长（小时）")
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES), help="不可选中区间的处理模式")
+    parser.add_argument("--child", type=float, help=argparse.SUPPRESS)
+    parser.add_argument("--child-mode", choices=list(MODES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        print(json.dumps(measure(int(args.child * 3600 * 1000), args.child_mode)))
+        return
+
+    print(f"{'时长(h)':>8} {'模式':>6} {'施法marker':>12} {'不可选中':>8} {'tracemalloc峰值(KB)':>20} {'峰值RSS(KB)':>12}")
+    for hours in args.hours:
+        for mode in args.modes:
+            proc = subprocess.run([sys.executable, __file__, "--child", str(hours), "--child-mode", mode],
+                                  capture_output=True, text=True, check=True)
+            result = json.loads(proc.stdout)
+            print(f"{hours:>8} {mode:>6} {result['cast_markers']:>12} {result['untarget_markers']:>8} "
+                  f"{result['traced_peak_kb']:>20} {str(result['max_rss_kb']):>12}")
+
+
+if __name__ == '__main__':
+    main()
@@ -68,6 +68,11 @@ class ConfigManager:
 
         ConfigManager.save_all_config(all_data)
 
+    @staticmethod
+    def get_zone_rules(zone_id):
+        """读取特定区域的施法过滤规则参数 (只包含用户改过的键，其余由 markergen 取默认值)"""
+        return ConfigManager.get_zone_config(zone_id).get('rules', {})
+
     @staticmethod
     def get_api_key():
         all_data = ConfigManager.load_all_config()
@@ -0,0 +1,283 @@
+import mmap
+import struct
+import weakref
+
+from markergen import (Fight, FightEvents, RuntimeConfig, parse_url, fetch_fight_events,
+                       process_cast_events, process_untargetable_events)
+
+# --- 存档格式 ---
+# 文件头 | 施法记录 | 可选中状态记录 | overkill 记录 | 字符串表
+# 所有记录均为定长小端二进制，读取时通过 mmap + memoryview 直接解析，不做整体拷贝
+
+ARCHIVE_MAGIC = b"XITS"
+ARCHIVE_VERSION = 1
+
+# magic, version, 保留, start_time, end_time, fight_id, zone_id, zone_name 索引, time_offset,
+# 施法记录数, 可选中状态记录数, overkill 记录数, 字符串表偏移
+HEADER = struct.Struct("<4sHHqqiiIqIIIQ")
+# timestamp, duration, sourceInstance, 技能名索引, 事件类型索引
+CAST_RECORD = struct.Struct("<qiiIH2x")
+# timestamp, sourceID, targetID, targetable, flags
+SUMMARY_RECORD = struct.Struct("<qiibB2x")
+# timestamp, targetID
+OVERKILL_RECORD = struct.Struct("<qi4x")
+STRING_LEN = struct.Struct("<I")
+
+# 可选中状态记录的 flags
+FLAG_SOURCE_NPC = 0x01
+FLAG_TARGET_NPC = 0x02
+FLAG_SOURCE_FRIENDLY = 0x04
+FLAG_HAS_TARGETABLE = 0x08
+FLAG_HAS_SOURCE_ID = 0x10
+
+
+class _StringTable:
+    def __init__(self):
+        self.strings = []
+        self.index = {}
+
+    def add(self, value):
+        idx = self.index.get(value)
+        if idx is None:
+            idx = len(self.strings)
+            self.index[value] = idx
+            self.strings.append(value)
+        return idx
+
+    def to_bytes(self):
+        parts = [STRING_LEN.pack(len(self.strings))]
+        for value in self.strings:
+            data = value.encode("utf-8")
+            parts.append(STRING_LEN.pack(len(data)))
+            parts.append(data)
+        return b"".join(parts)
+
+
+def _is_npc(unit):
+    return isinstance(unit, dict) and unit.get('type') == 'NPC'
+
+
+def dump_archive(fight_events):
+    """将 FightEvents 序列化为存档字节串"""
+    strings = _StringTable()
+    fight = fight_events.fight
+
+    cast_parts = []
+    for e in fight_events.cast_events:
+        cast_parts.append(CAST_RECORD.pack(
+            e['timestamp'],
+            e.get('duration', 0),
+            e.get('sourceInstance', 0),
+            strings.add(e.get('ability', {}).get('name', '')),
+            strings.add(e.get('type', 'cast'))
+        ))
+
+    summary_parts = []
+    for e in fight_events.summary_events:
+        flags = 0
+        if _is_npc(e.get('source')): flags |= FLAG_SOURCE_NPC
+        if _is_npc(e.get('target')): flags |= FLAG_TARGET_NPC
+        if e.get('sourceIsFriendly', False): flags |= FLAG_SOURCE_FRIENDLY
+        if 'targetable' in e: flags |= FLAG_HAS_TARGETABLE
+        if 'sourceID' in e: flags |= FLAG_HAS_SOURCE_ID
+        summary_parts.append(SUMMARY_RECORD.pack(
+            e['timestamp'],
+            e.get('sourceID', 0),
+            e.get('targetID', 0),
+            e.get('targetable', 0),
+            flags
+        ))
+
+    overkill_parts = [OVERKILL_RECORD.pack(e['timestamp'], e.get('targetID', 0))
+                      for e in fight_events.overkill_events]
+
+    zone_name_idx = strings.add(fight.zone_name)
+    body = b"".join(cast_parts) + b"".join(summary_parts) + b"".join(overkill_parts)
+    header = HEADER.pack(
+        ARCHIVE_MAGIC, ARCHIVE_VERSION, 0,
+        fight.start_time, fight.end_time, fight.fight_id, fight.zone_id, zone_name_idx,
+        fight_events.time_offset,
+        len(cast_parts), len(summary_parts), len(overkill_parts),
+        HEADER.size + len(body)
+    )
+    return header + body + strings.to_bytes()
+
+
+def write_archive(path, fight_events):
+    with open(path, 'wb') as f:
+        f.write(dump_archive(fight_events))
+
+
+def archive_report(path, logs_url, api_key, is_translate=False):
+    """下载一场战斗的原始事件并写入存档，找不到战斗时返回 None"""
+    logs_id, fight_id = parse_url(logs_url)
+    config = RuntimeConfig(logs_id, fight_id, api_key, translate=is_translate)
+    fight_events = fetch_fight_events(config)
+    if fight_events is None:
+        return None
+    write_archive(path, fight_events)
+    return fight_events.fight
+
+
+class _RecordIterator:
+    """逐条解析一段定长记录；存档关闭后继续迭代会抛出 ValueError，而不是悄悄结束导致数据被截断"""
+
+    def __init__(self, chunk, record, convert):
+        self._chunk = chunk
+        self._it = record.iter_unpack(chunk)
+        self._convert = convert
+        self._closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._closed:
+            raise ValueError("archive is closed")
+        if self._it is None:
+            raise StopIteration
+        try:
+            values = next(self._it)
+        except StopIteration:
+            self._release()
+            raise
+        return self._convert(*values)
+
+    def _release(self):
+        if self._it is not None:
+            self._it = None
+            self._chunk.release()
+
+    def close(self):
+        self._closed = True
+        self._release()
+
+
+class EventArchive:
+    """
+    只读存档视图。
+    cast_events / summary_events / overkill_events 每次访问都返回一个新的迭代器，
+    直接从底层缓冲区逐条解析记录，可以原样传给 process_* 处理函数
+    """
+
+    def __init__(self, buffer):
+        self._mmap = None
+        self._view = memoryview(buffer)
+        self._closed = False
+        # 尚未迭代完的记录迭代器，close() 时先关闭它们以释放对缓冲区的引用
+        self._live_records = weakref.WeakSet()
+
+        try:
+            (magic, version, _, start_time, end_time, fight_id, zone_id, zone_name_idx, time_offset,
+             self.cast_count, self.summary_count, self.overkill_count, strings_offset) = HEADER.unpack_from(self._view)
+            if magic != ARCHIVE_MAGIC:
+                raise ValueError("不是有效的事件存档文件")
+            if version != ARCHIVE_VERSION:
+                raise ValueError(f"不支持的存档版本: {version}")
+
+            self._strings = self._read_strings(strings_offset)
+        except Exception:
+            self._view.release()
+            raise
+
+        self._cast_offset = HEADER.size
+        self._summary_offset = self._cast_offset + self.cast_count * CAST_RECORD.size
+        self._overkill_offset = self._summary_offset + self.summary_count * SUMMARY_RECORD.size
+
+        self.fight = Fight(start_time, end_time, fight_id, zone_id, self._strings[zone_name_idx])
+        self.time_offset = time_offset
+
+    @classmethod
+    def open(cls, path):
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            archive = cls(mm)
+        except Exception:
+            mm.close()
+            raise
+        archive._mmap = mm
+        return archive
+
+    def close(self):
+        self._closed = True
+        for records in list(self._live_records):
+            records.close()
+        self._view.release()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _read_strings(self, offset):
+        view = self._view
+        (count,) = STRING_LEN.unpack_from(view, offset)
+        offset += STRING_LEN.size
+        strings = []
+        for _ in range(count):
+            (length,) = STRING_LEN.unpack_from(view, offset)
+            offset += STRING_LEN.size
+            strings.append(str(view[offset:offset + length], "utf-8"))
+            offset += length
+        return strings
+
+    def _records(self, record, offset, count, convert):
+        if self._closed:
+            raise ValueError("archive is closed")
+        records = _RecordIterator(self._view[offset:offset + count * record.size], record, convert)
+        self._live_records.add(records)
+        return records
+
+    @property
+    def cast_events(self):
+        strings = self._strings
+
+        def convert(timestamp, duration, source_instance, name_idx, type_idx):
+            return {
+                'timestamp': timestamp,
+                'type': strings[type_idx],
+                'sourceInstance': source_instance,
+                'duration': duration,
+                'ability': {'name': strings[name_idx]}
+            }
+
+        return self._records(CAST_RECORD, self._cast_offset, self.cast_count, convert)
+
+    @property
+    def summary_events(self):
+        def convert(timestamp, source_id, target_id, targetable, flags):
+            event = {
+                'timestamp': timestamp,
+                'targetID': target_id,
+                'sourceIsFriendly': bool(flags & FLAG_SOURCE_FRIENDLY)
+            }
+            if flags & FLAG_HAS_SOURCE_ID: event['sourceID'] = source_id
+            if flags & FLAG_HAS_TARGETABLE: event['targetable'] = targetable
+            if flags & FLAG_SOURCE_NPC: event['source'] = {'type': 'NPC'}
+            if flags & FLAG_TARGET_NPC: event['target'] = {'type': 'NPC'}
+            return event
+
+        return self._records(SUMMARY_RECORD, self._summary_offset, self.summary_count, convert)
+
+    @property
+    def overkill_events(self):
+        def convert(timestamp, target_id):
+            return {'timestamp': timestamp, 'targetID': target_id}
+
+        return self._records(OVERKILL_RECORD, self._overkill_offset, self.overkill_count, convert)
+
+    def to_fight_events(self):
+        """完整解析为内存中的 FightEvents"""
+        return FightEvents(self.fight, self.time_offset, list(self.cast_events),
+                           list(self.summary_events), list(self.overkill_events))
+
+    def cast_source(self, rules=None):
+        return process_cast_events(self.cast_events, self.time_offset, rules)
+
+    def untargetable_list(self):
+        return process_untargetable_events(self.summary_events, self.overkill_events, self.fight, self.time_offset)
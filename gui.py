@@ -1,11 +1,12 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import json
-import traceback
 import re
 
 from config_manager import ConfigManager
-from markergen import fetch_log_data, generate_final_json
+
+# 为了让窗口尽快显示，markergen (以及 requests) 和 traceback 在首次使用时才导入；
+# json / re 启动时已经被 config_manager / tkinter 导入，无需推迟
 
 
 def center_window(window, width, height):
@@ -37,6 +38,7 @@ class SkillConfigDialog(tk.Toplevel):
 
         # 1. 读取全局配置 
         global_settings = ConfigManager.get_global_settings()
+        self.saved_global_settings = global_settings
         default_interval = global_settings.get('min_interval', 3000)
         default_tracks = global_settings.get('max_tracks', 20)
 
@@ -48,6 +50,7 @@ class SkillConfigDialog(tk.Toplevel):
             self.saved_zone_config = {}
 
         saved_skills = self.saved_zone_config.get('skills', {})
+        self.saved_skills = saved_skills
 
         self.transient(parent)
         self.grab_set()
@@ -66,6 +69,15 @@ class SkillConfigDialog(tk.Toplevel):
         self.tracks_entry.insert(0, str(default_tracks))
         self.tracks_entry.grid(row=0, column=3, padx=5)
 
+        # 留空表示导出整场战斗
+        tk.Label(top_frame, text="导出起始(秒):").grid(row=1, column=0, padx=5, pady=(5, 0))
+        self.range_start_entry = tk.Entry(top_frame, width=10)
+        self.range_start_entry.grid(row=1, column=1, padx=5, pady=(5, 0))
+
+        tk.Label(top_frame, text="导出结束(秒):").grid(row=1, column=2, padx=5, pady=(5, 0))
+        self.range_end_entry = tk.Entry(top_frame, width=10)
+        self.range_end_entry.grid(row=1, column=3, padx=5, pady=(5, 0))
+
         # --- 中部：技能列表  ---
         list_frame = tk.LabelFrame(self, text="技能筛选与重命名", padx=5, pady=5)
         list_frame.pack(fill='both', expand=True, padx=10, pady=5)
@@ -136,6 +148,21 @@ class SkillConfigDialog(tk.Toplevel):
             messagebox.showerror("输入错误", "时间间隔和轨道数必须是整数")
             return
 
+        range_start = self.range_start_entry.get().strip()
+        range_end = self.range_end_entry.get().strip()
+        time_range = None
+        if range_start or range_end:
+            try:
+                start_ms = int(float(range_start) * 1000) if range_start else 0
+                end_ms = int(float(range_end) * 1000) if range_end else float('inf')
+            except (ValueError, OverflowError):
+                messagebox.showerror("输入错误", "导出时间段必须是数字 (秒)")
+                return
+            if start_ms >= end_ms:
+                messagebox.showerror("输入错误", "导出结束时间必须大于起始时间")
+                return
+            time_range = (start_ms, end_ms)
+
         filter_map = {}
         skills_config_to_save = {}
 
@@ -151,11 +178,18 @@ class SkillConfigDialog(tk.Toplevel):
             if is_checked:
                 filter_map[original_name] = rename_val if rename_val else original_name
 
+        # 只在配置有变化时写文件
+        global_changed = (self.saved_global_settings.get('min_interval') != min_interval or
+                          self.saved_global_settings.get('max_tracks') != max_tracks)
+        skills_changed = any(self.saved_skills.get(name) != conf for name, conf in skills_config_to_save.items())
+
         try:
             # 1. 保存全局配置
-            ConfigManager.save_global_settings(min_interval, max_tracks)
+            if global_changed:
+                ConfigManager.save_global_settings(min_interval, max_tracks)
             # 2. 保存区域技能配置
-            ConfigManager.update_zone_skills(self.zone_id, skills_config_to_save)
+            if skills_changed:
+                ConfigManager.update_zone_skills(self.zone_id, skills_config_to_save)
         except Exception as e:
             messagebox.showerror("保存失败", f"无法保存配置文件:\n{e}")
             return
@@ -165,6 +199,8 @@ class SkillConfigDialog(tk.Toplevel):
             'max_tracks': max_tracks,
             'filter_map': filter_map
         }
+        if time_range is not None:
+            self.result['time_range'] = time_range
         self.destroy()
 
 
@@ -180,10 +216,13 @@ class Application(tk.Tk):
 
         self.generated_data = None
         self.current_zone_name = None  # 新增：用于保存时的文件名
+        self.fetched_data = None  # (cast_list, untarget_list, fight)，重新配置时复用，不再重新下载
 
         self.create_widgets()
 
     def show_error(self, exc, val, tb):
+        import traceback
+
         err_msg = "".join(traceback.format_exception(exc, val, tb))
         print(err_msg)
         messagebox.showerror("未处理的错误", f"发生意外错误:\n{val}")
@@ -210,8 +249,14 @@ class Application(tk.Tk):
         tk.Checkbutton(self, text="请求时自动翻译 (&translate=true)[只能翻译成英文]", variable=self.translate_var).pack(anchor='w',
                                                                                                         **padding)
 
-        self.btn_generate = tk.Button(self, text="获取数据并配置...", command=self.on_process_start, bg="#dddddd")
-        self.btn_generate.pack(pady=15)
+        gen_frame = tk.Frame(self)
+        gen_frame.pack(pady=15)
+
+        self.btn_generate = tk.Button(gen_frame, text="获取数据并配置...", command=self.on_process_start, bg="#dddddd")
+        self.btn_generate.pack(side='left', padx=5)
+
+        self.btn_reconfigure = tk.Button(gen_frame, text="重新配置...", command=self.on_reconfigure, state='disabled')
+        self.btn_reconfigure.pack(side='left', padx=5)
 
         self.status_label = tk.Label(self, text="准备就绪", fg="gray")
         self.status_label.pack()
@@ -243,6 +288,8 @@ class Application(tk.Tk):
         self.status_label.config(text="正在从 FFLogs 下载数据...", fg="blue")
         self.update()
 
+        from markergen import fetch_log_data
+
         cast_list, untarget_list, fight, msg = fetch_log_data(url, api_key, self.translate_var.get())
 
         if cast_list is None:
@@ -252,8 +299,18 @@ class Application(tk.Tk):
 
         # 记录 Zone Name 供保存使用
         self.current_zone_name = fight.zone_name
+        self.fetched_data = (cast_list, untarget_list, fight)
+        self.btn_reconfigure.config(state='normal')
 
         self.status_label.config(text="数据获取成功，等待配置...", fg="orange")
+        self.configure_and_generate()
+
+    def on_reconfigure(self):
+        if self.fetched_data is None: return
+        self.configure_and_generate()
+
+    def configure_and_generate(self):
+        cast_list, untarget_list, fight = self.fetched_data
 
         unique_skills = set(marker.desc for marker in cast_list)
 
@@ -266,6 +323,8 @@ class Application(tk.Tk):
 
         self.status_label.config(text="正在处理...", fg="blue")
 
+        from markergen import generate_final_json
+
         try:
             json_obj = generate_final_json(cast_list, untarget_list, dialog.result)
             self.generated_data = json.dumps(json_obj, ensure_ascii=False, indent=2)
@@ -0,0 +1,54 @@
+import argparse
+import subprocess
+import sys
+
+
+def measure(statement):
+    """
+    用 python -X importtime 在全新的解释器中执行 statement，
+    返回 [(cumulative_us, self_us, module_name, depth)]
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "导入失败")
+
+    entries = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((int(cumulative_us), int(self_us), name.strip(), depth))
+    return entries
+
+
+def report(statement, top):
+    entries = measure(statement)
+    total_ms = sum(entry[1] for entry in entries) / 1000
+    print(f"{statement}: {len(entries)} 个模块, 共 {total_ms:.1f} ms")
+
+    # 只列出由 statement 直接触发的顶层导入
+    roots = sorted((entry for entry in entries if entry[3] == 0), reverse=True)
+    for cumulative_us, _, name, _ in roots[:top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+    return total_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="报告模块导入耗时，用于比较启动速度")
+    parser.add_argument("statements", nargs="*",
+                        default=["import gui", "import gui, markergen, requests, json, traceback"],
+                        help="要测量的导入语句，默认对比 GUI 启动时与首次请求后的导入")
+    parser.add_argument("-n", "--top", type=int, default=10, help="列出的顶层模块数")
+    args = parser.parse_args()
+
+    for statement in args.statements:
+        report(statement, args.top)
+        print()
+
+
+if __name__ == '__main__':
+    main()
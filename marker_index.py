@@ -0,0 +1,81 @@
+from bisect import bisect_left
+
+
+class MarkerIndex:
+    """
+    按时间排序并用 bisect 索引的 marker 集合，用于阶段切片与窗口查询。
+    输入为 get_cast_source / get_untargetable_list 的输出（时间单位均为毫秒），
+    导出切片时沿用 marker 上已有的 track（即上一次 make_track_list 的排布），不重新排轨。
+    """
+
+    def __init__(self, cast_list, untarget_list=()):
+        self.cast_markers = sorted(cast_list, key=lambda x: x.time)
+        self.cast_times = [marker.time for marker in self.cast_markers]
+        self.max_cast_duration = max((marker.duration for marker in self.cast_markers), default=0)
+
+        self.untarget_markers = sorted(untarget_list, key=lambda x: x.time)
+        self.untarget_times = [marker.time for marker in self.untarget_markers]
+        self.max_untarget_duration = max((marker.duration for marker in self.untarget_markers), default=0)
+
+    @staticmethod
+    def _starting_in(markers, times, start, end):
+        return markers[bisect_left(times, start):bisect_left(times, end)]
+
+    @staticmethod
+    def _overlapping(markers, times, max_duration, start, end):
+        # 起点早于 start - max_duration 的 marker 不可能与区间重叠
+        lo = bisect_left(times, start - max_duration)
+        hi = bisect_left(times, end)
+        return [marker for marker in markers[lo:hi] if marker.get_cast_end_time() > start or marker.time >= start]
+
+    def query(self, start, end):
+        """起始时间落在 [start, end) 内的施法 marker，O(log n + k)"""
+        return self._starting_in(self.cast_markers, self.cast_times, start, end)
+
+    def query_overlapping(self, start, end):
+        """与 [start, end) 有交集的施法 marker"""
+        return self._overlapping(self.cast_markers, self.cast_times, self.max_cast_duration, start, end)
+
+    def untargetable_overlapping(self, start, end):
+        """与 [start, end) 有交集的不可选中区间"""
+        return self._overlapping(self.untarget_markers, self.untarget_times, self.max_untarget_duration, start, end)
+
+    def around_untargetable(self, before, after):
+        """返回 [(不可选中区间, 区间前 before 毫秒到区间后 after 毫秒内开始的施法 marker)]"""
+        return [(window, self.query(window.time - before, window.get_cast_end_time() + after))
+                for window in self.untarget_markers]
+
+    def export_slice(self, start, end, rebase=True):
+        """
+        导出 [start, end) 时间段的 MarkerTracksCombined
+        :param rebase: 为 True 时以 start 为新的 0 点
+        """
+        offset = start if rebase else 0
+
+        untarget_markers = []
+        for window in self.untargetable_overlapping(start, end):
+            # 不可选中区间裁剪到切片范围内
+            clip_start = max(window.time, start)
+            clip_end = min(window.get_cast_end_time(), end)
+            untarget_markers.append(window.copy(time=clip_start - offset, duration=clip_end - clip_start))
+
+        cast_by_track = {}
+        for marker in self.query(start, end):
+            cast_by_track.setdefault(marker.track, []).append(marker.copy(time=marker.time - offset))
+
+        tracks = [{
+            "fileType": "MarkerTrackIndividual",
+            "track": -1,
+            "markers": [marker.to_dict() for marker in untarget_markers]
+        }]
+        for track in sorted(cast_by_track):
+            tracks.append({
+                "fileType": "MarkerTrackIndividual",
+                "track": track,
+                "markers": [marker.to_dict() for marker in cast_by_track[track]]
+            })
+
+        return {
+            'fileType': "MarkerTracksCombined",
+            "tracks": tracks
+        }
@@ -1,5 +1,13 @@
+import hashlib
+import heapq
 import re
-import requests
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from config_manager import ConfigManager
+from marker_index import MarkerIndex
 
 # --- 常量定义 ---
 FIGHTS_URL_PREFIX = "https://cn.fflogs.com/v1/report/fights/"
@@ -8,6 +16,21 @@ SUMMARY_URL_PREFIX = "https://cn.fflogs.com/v1/report/events/summary/"
 DAMAGE_URL_PREFIX = "https://cn.fflogs.com/v1/report/events/damage-taken/"
 ANY_URL_PREFIX = "https://cn.fflogs.com/v1/report/events/any/"
 
+LOGS_ID_PATTERN = re.compile(r'reports/([a-zA-Z0-9]+)')
+FIGHT_ID_PATTERN = re.compile(r'fight=([^&]+)')
+
+# 报告元数据（战斗列表）缓存：仍在记录中的报告只缓存 LIVE_REPORT_TTL 秒，
+# 最后一条记录距今超过 REPORT_FINISHED_AFTER 毫秒的报告视为已结束，一直保留（按 LRU 淘汰）
+LIVE_REPORT_TTL = 30
+REPORT_FINISHED_AFTER = 60 * 60 * 1000
+MAX_CACHED_REPORTS = 256
+
+# 流式模式 (iter_untargetable_markers) 下，只有 overkill 的分块最多等待这么久（毫秒）看是否出现同向的
+# targetability 事件，超时按 overkill 时间定案，使缓存的事件不随报告长度增长。
+# 这是流式模式的已知近似：超过该窗口才出现的同向 targetability 事件不会再替换 overkill 的时间。
+# 列表接口 process_untargetable_events 不使用该窗口，结果与一次性处理完全一致
+UNTARGETABLE_RESOLVE_WINDOW = 60000
+
 
 # --- 数据模型类 ---
 
@@ -29,6 +52,36 @@ class Fight:
         self.zone_name = zone_name
 
 
+class ReportMetadata:
+    def __init__(self, fights, finished):
+        self.fights = fights
+        self.fights_by_id = {fight['id']: fight for fight in fights}
+        self.finished = finished
+        self.fetched_at = time.monotonic()
+
+    def is_recent(self):
+        return time.monotonic() - self.fetched_at < LIVE_REPORT_TTL
+
+    def is_fresh(self):
+        return self.finished or self.is_recent()
+
+    def find_fight(self, fight_id):
+        if fight_id == "last":
+            return self.fights[-1] if self.fights else None
+        return self.fights_by_id.get(fight_id)
+
+
+class FightEvents:
+    """一场战斗的原始事件（施法 / 可选中状态 / overkill），与后处理解耦，便于存档与重放"""
+
+    def __init__(self, fight, time_offset, cast_events, summary_events, overkill_events):
+        self.fight = fight
+        self.time_offset = time_offset
+        self.cast_events = cast_events
+        self.summary_events = summary_events
+        self.overkill_events = overkill_events
+
+
 class Marker:
     def __init__(self, time, marker_type, duration, desc, source, raw):
         self.time = time
@@ -54,12 +107,33 @@ class Marker:
     def get_cast_end_time(self):
         return self.time + self.duration
 
+    def copy(self, time=None, duration=None, desc=None):
+        m = Marker(self.time if time is None else time, self.marker_type,
+                   self.duration if duration is None else duration,
+                   self.desc if desc is None else desc, self.source, self.raw)
+        m.color = self.color
+        m.show_text = self.show_text
+        m.track = self.track
+        return m
+
 
 # --- 核心功能函数 ---
 
+def get_json(url, timeout, session=None):
+    # requests (连同 urllib3/certifi) 导入较慢，推迟到第一次请求时再导入，加快程序启动
+    if session is None:
+        import requests
+        session = requests
+
+    response = session.get(url, timeout=timeout)
+    response.raise_for_status()  # 如果是 404/500 等错误，这里会抛出 HTTPError
+    return response.json()
+
+
+@lru_cache(maxsize=256)
 def parse_url(url):
-    log_match = re.search(r'reports/([a-zA-Z0-9]+)', url)
-    fight_match = re.search(r'fight=([^&]+)', url)
+    log_match = LOGS_ID_PATTERN.search(url)
+    fight_match = FIGHT_ID_PATTERN.search(url)
 
     if not log_match:
         raise ValueError("无法从链接中解析出 Logs ID，请检查链接格式。")
@@ -81,20 +155,67 @@ def parse_url(url):
     return logs_id, fight_id
 
 
-def get_fight_data(config):
+_report_cache = OrderedDict()
+_report_cache_lock = threading.Lock()
+
+
+def clear_report_cache():
+    with _report_cache_lock:
+        _report_cache.clear()
+
+
+def _report_cache_key(config):
+    return config.logs_id, config.api_key, config.translate_param
+
+
+def _get_cached_report_metadata(config):
+    key = _report_cache_key(config)
+    with _report_cache_lock:
+        metadata = _report_cache.get(key)
+        if metadata is not None and metadata.is_fresh():
+            _report_cache.move_to_end(key)
+            return metadata
+    return None
+
+
+def get_report_metadata(config, session=None, refresh=False):
+    """读取报告的战斗列表，优先使用缓存；refresh 为 True 时忽略缓存重新下载"""
+    if not refresh:
+        metadata = _get_cached_report_metadata(config)
+        if metadata is not None:
+            return metadata
+
     # 移除 try-except，让错误抛出
     url = f"{FIGHTS_URL_PREFIX}{config.logs_id}?api_key={config.api_key}{config.translate_param}"
 
-    response = requests.get(url, timeout=10)  # 增加 timeout
-    response.raise_for_status()  # 如果是 404/500 等错误，这里会抛出 HTTPError
+    data = get_json(url, timeout=10, session=session)  # 增加 timeout
+    report_end = data.get('end')
+    finished = report_end is not None and time.time() * 1000 - report_end > REPORT_FINISHED_AFTER
+    metadata = ReportMetadata(data.get('fights', []), finished)
 
-    data = response.json()
-    fights = data.get('fights', [])
+    key = _report_cache_key(config)
+    with _report_cache_lock:
+        _report_cache[key] = metadata
+        _report_cache.move_to_end(key)
+        while len(_report_cache) > MAX_CACHED_REPORTS:
+            _report_cache.popitem(last=False)
 
-    if config.fight_id == "last":
-        fight_data = fights[-1] if fights else None
-    else:
-        fight_data = next((fight for fight in fights if fight['id'] == config.fight_id), None)
+    return metadata
+
+
+def get_fight_data(config, session=None):
+    fight_data = None
+    metadata = _get_cached_report_metadata(config)
+    if metadata is not None:
+        fight_data = metadata.find_fight(config.fight_id)
+        # 缓存里找不到的 fight 可能是刚上传的（"已结束"的报告休息一段时间后也可能继续记录），一律重新下载；
+        # last 会随新上传的战斗变化，只信任刚下载不久的缓存
+        if fight_data is None or (config.fight_id == "last" and not metadata.is_recent()):
+            metadata = None
+
+    if metadata is None:
+        metadata = get_report_metadata(config, session, refresh=True)
+        fight_data = metadata.find_fight(config.fight_id)
 
     if fight_data is None:
         return None
@@ -105,14 +226,12 @@ def get_fight_data(config):
     return Fight(fight_data["start_time"], fight_data["end_time"], fight_data["id"], zone_id, zone_name)
 
 
-def get_real_fight_offset(fight, config):
+def get_real_fight_offset(fight, config, session=None):
     # 移除 try-except
     search_end = fight.start_time + 5000
     damage_url = f"{DAMAGE_URL_PREFIX}{config.logs_id}?start={fight.start_time}&end={search_end}&hostility=1&api_key={config.api_key}{config.translate_param}"
 
-    response = requests.get(damage_url, timeout=10)
-    response.raise_for_status()
-    data = response.json()
+    data = get_json(damage_url, timeout=10, session=session)
     events = data.get('events', [])
     for event in events:
         if event.get('type') == 'damage':
@@ -121,109 +240,220 @@ def get_real_fight_offset(fight, config):
     return fight.start_time
 
 
-def get_cast_source(fight, config, time_offset):
-    # 移除 try-except
-    url = f"{CASTS_URL_PREFIX}{config.logs_id}?start={fight.start_time}&end={fight.end_time}&hostility=1&api_key={config.api_key}{config.translate_param}"
+def iter_report_events(url_prefix, config, start, end, query, timeout=10, session=None):
+    """逐页下载 [start, end) 内的事件并逐条产出，单页放不下时按 nextPageTimestamp 翻页"""
+    while start is not None:
+        # 移除 try-except
+        url = f"{url_prefix}{config.logs_id}?start={start}&end={end}{query}&api_key={config.api_key}{config.translate_param}"
+        data = get_json(url, timeout=timeout, session=session)
+        yield from data.get('events', [])
 
-    response = requests.get(url, timeout=20)  # 施法列表可能很大，超时给长一点
-    response.raise_for_status()
-    data = response.json()
+        next_start = data.get('nextPageTimestamp')
+        start = next_start if next_start is not None and start < next_start < end else None
 
-    events = data.get('events', [])
-    clean_events = []
-
-    for i, event in enumerate(events):
-        name = event.get('ability', {}).get('name', '')
-
-        clean_events.append({
-            'original_index': i,
-            'event': event,
-            'timestamp': event['timestamp'],
-            'sourceInstance': event.get('sourceInstance', 0),
-            'ability_name': name,
-            'to_delete': False
-        })
 
-    group_map = {}
-    for item in clean_events:
-        key = (item['timestamp'], item['ability_name'])
-        if key not in group_map: group_map[key] = []
-        group_map[key].append(item)
-
-    hidden_cleanup_tasks = []
-    for key, items in group_map.items():
-        if len(items) > 1:
-            items.sort(key=lambda x: x['sourceInstance'])
-            hidden_units = items[1:]
-            for hidden in hidden_units:
-                if hidden.get('event', {}).get('type', 'cast') == 'begincast':
-                    hidden['to_delete'] = True
-                    hidden_cleanup_tasks.append({
-                        'sourceInstance': hidden['sourceInstance'],
-                        'ability_name': hidden['ability_name'],
-                        'search_start_idx': clean_events.index(hidden) + 1,
-                        'origin_time': hidden['timestamp'],
-                        'origin_duration': hidden['event'].get('duration', 0)
-                    })
-
-    for task in hidden_cleanup_tasks:
-        s_id = task['sourceInstance']
-        a_name = task['ability_name']
-        start_idx = task['search_start_idx']
-        window_start = task['origin_time'] + task['origin_duration']
-        window_end = window_start + 3000
-
-        for i in range(start_idx, len(clean_events)):
-            target_item = clean_events[i]
-            target_ts = target_item['timestamp']
-            if target_item['sourceInstance'] == s_id and target_item['ability_name'] == a_name:
-                target_item['to_delete'] = True
-                break
-
-    source = []
-    for item in clean_events:
-        if item['to_delete']:
-            continue
+def iter_cast_events(fight, config, session=None):
+    # 施法列表可能很大，超时给长一点
+    return iter_report_events(CASTS_URL_PREFIX, config, fight.start_time, fight.end_time, "&hostility=1",
+                              timeout=20, session=session)
 
-        event = item['event']
-        desc = item['ability_name']
-        duration = event.get('duration', 0)
-        timestamp = item['timestamp']
 
-        if duration > 0 and duration < 500:
-            continue
+def fetch_cast_events(fight, config, session=None):
+    return list(iter_cast_events(fight, config, session))
 
-        m = Marker(timestamp - time_offset, "Info", duration, desc, "casts", event)
-        source.append(m)
 
-    final_source = []
-    cast_ignore_time = 100
-    last_marker = None
-    for marker in source:
-        if (last_marker is not None and marker.desc == last_marker.desc and
-                marker.duration == last_marker.duration and
-                marker.time - last_marker.time < cast_ignore_time):
-            continue
-        final_source.append(marker)
-        last_marker = marker
+# --- 施法事件规则流水线 ---
+# 每条规则都是 stage(stream) -> stream 的生成器，按顺序串联；事件须按时间排序
 
-    return final_source
+DEFAULT_CAST_RULES = {
+    'remove_hidden_units': True,  # 移除同一时刻同名技能的隐藏单位读条，以及该单位随后的同名事件
+    'min_cast_duration': 500,  # 丢弃 0 < duration < min_cast_duration 的读条
+    'cast_ignore_time': 100,  # 相同 (desc, duration) 的 marker 在此间隔内只保留第一个
+}
 
 
-def get_untargetable_list(fight, config, time_offset):
+def _ability_name(event):
+    return event.get('ability', {}).get('name', '')
+
+
+def rule_remove_hidden_units(events):
+    # 待删除的 (sourceInstance, ability_name)：隐藏单位之后的第一个同源同名事件
+    pending = set()
+    group = []
+    group_ts = None
+
+    def flush(group):
+        by_name = {}
+        for event in group:
+            by_name.setdefault(_ability_name(event), []).append(event)
+
+        hidden = set()
+        for items in by_name.values():
+            if len(items) > 1:
+                items = sorted(items, key=lambda x: x.get('sourceInstance', 0))
+                for item in items[1:]:
+                    if item.get('type', 'cast') == 'begincast':
+                        hidden.add(id(item))
+
+        for event in group:
+            key = (event.get('sourceInstance', 0), _ability_name(event))
+            to_delete = False
+            if key in pending:
+                pending.discard(key)
+                to_delete = True
+            if id(event) in hidden:
+                pending.add(key)
+                to_delete = True
+            if not to_delete:
+                yield event
+
+    for event in events:
+        ts = event['timestamp']
+        if ts != group_ts and group:
+            yield from flush(group)
+            group = []
+        group_ts = ts
+        group.append(event)
+    if group:
+        yield from flush(group)
+
+
+def rule_min_cast_duration(min_duration):
+    def stage(events):
+        for event in events:
+            duration = event.get('duration', 0)
+            if 0 < duration < min_duration:
+                continue
+            yield event
+    return stage
+
+
+def stage_to_markers(time_offset):
+    def stage(events):
+        for event in events:
+            yield Marker(event['timestamp'] - time_offset, "Info", event.get('duration', 0), _ability_name(event),
+                         "casts", event)
+    return stage
+
+
+def rule_dedup_markers(ignore_time):
+    def stage(markers):
+        # (desc, duration) -> 上一个保留的同类 marker 时间，可识别被其他施法者打断的非相邻重复
+        last_seen = {}
+        prune_at = 256
+        for marker in markers:
+            key = (marker.desc, marker.duration)
+            last_time = last_seen.get(key)
+            if last_time is not None and marker.time - last_time < ignore_time:
+                continue
+            last_seen[key] = marker.time
+
+            if len(last_seen) > prune_at:
+                # 早于 ignore_time 的记录不会再命中，清理掉，使内存不随战斗时长增长
+                last_seen = {k: t for k, t in last_seen.items() if marker.time - t < ignore_time}
+                prune_at = max(256, 2 * len(last_seen))
+            yield marker
+    return stage
+
+
+_TRUE_STRINGS = ('true', '1', 'yes', 'on')
+_FALSE_STRINGS = ('false', '0', 'no', 'off')
+
+
+def _rule_to_bool(key, value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in _TRUE_STRINGS + _FALSE_STRINGS:
+        return value.strip().lower() in _TRUE_STRINGS
+    raise ValueError(f"施法过滤规则 {key} 应为 true/false，实际为 {value!r}")
+
+
+def _rule_to_int(key, value):
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, (int, str)) and not isinstance(value, bool):
+        try:
+            return int(value)
+        except ValueError:
+            pass
+    raise ValueError(f"施法过滤规则 {key} 应为整数（毫秒），实际为 {value!r}")
+
+
+def normalize_cast_rules(rules=None):
+    """
+    校验 timeline_config.json 中的规则参数（可只包含部分键），返回补全默认值后的完整参数。
+    拼错的键或无法转换的值抛出 ValueError 并指明是哪个键
+    """
+    params = dict(DEFAULT_CAST_RULES)
+    for key, value in (rules or {}).items():
+        if key not in DEFAULT_CAST_RULES:
+            raise ValueError(f"未知的施法过滤规则: {key}（可用: {', '.join(DEFAULT_CAST_RULES)}）")
+        if isinstance(DEFAULT_CAST_RULES[key], bool):
+            params[key] = _rule_to_bool(key, value)
+        else:
+            params[key] = _rule_to_int(key, value)
+    return params
+
+
+def build_cast_pipeline(time_offset, rules=None):
+    """根据规则参数（可只包含部分键，其余取默认值）组装流水线"""
+    params = normalize_cast_rules(rules)
+
+    pipeline = []
+    if params['remove_hidden_units']:
+        pipeline.append(rule_remove_hidden_units)
+    if params['min_cast_duration'] > 0:
+        pipeline.append(rule_min_cast_duration(params['min_cast_duration']))
+    pipeline.append(stage_to_markers(time_offset))
+    if params['cast_ignore_time'] > 0:
+        pipeline.append(rule_dedup_markers(params['cast_ignore_time']))
+    return pipeline
+
+
+def run_pipeline(stream, pipeline):
+    for stage in pipeline:
+        stream = stage(stream)
+    return stream
+
+
+def iter_cast_markers(events, time_offset, rules=None):
+    """流式版本：events 可以是任意按时间排序的可迭代对象，逐个产出 Marker"""
+    return run_pipeline(events, build_cast_pipeline(time_offset, rules))
+
+
+def process_cast_events(events, time_offset, rules=None):
+    """将施法事件（FFLogs 原始事件或存档记录）处理为 Marker 列表"""
+    return list(iter_cast_markers(events, time_offset, rules))
+
+
+def get_cast_source(fight, config, time_offset, rules=None):
+    return process_cast_events(iter_cast_events(fight, config), time_offset, rules)
+
+
+def iter_summary_events(fight, config, session=None):
+    filter_exp = 'type="targetabilityupdate"'
+    return iter_report_events(SUMMARY_URL_PREFIX, config, fight.start_time, fight.end_time,
+                              f"&hostility=1&filter={filter_exp}", session=session)
+
+
+def iter_overkill_events(fight, config, session=None):
+    filter_exp = "overkill>0"
+    return iter_report_events(DAMAGE_URL_PREFIX, config, fight.start_time, fight.end_time,
+                              f"&hostility=1&filter={filter_exp}", session=session)
+
+
+def fetch_untargetable_events(fight, config, session=None):
+    """下载可选中状态变化事件与 overkill 伤害事件，返回 (summary_events, overkill_events)"""
     # 这里我们也可以移除 try-except，或者保留它但明确如果失败返回空
     # 考虑到这些是辅助信息，如果失败可以不阻断主流程，但也建议抛出错误让用户知道网络有问题
     # 为了严谨，这里也改为抛出错误
-    source = []
-    events_list = []
+    return list(iter_summary_events(fight, config, session)), list(iter_overkill_events(fight, config, session))
 
-    filter_exp = 'type="targetabilityupdate"'
-    summary_url = f"{SUMMARY_URL_PREFIX}{config.logs_id}?start={fight.start_time}&end={fight.end_time}&hostility=1&filter={filter_exp}&api_key={config.api_key}{config.translate_param}"
-    # 允许这里失败抛出异常
-    resp = requests.get(summary_url, timeout=10)
-    resp.raise_for_status()
-    summary_data = resp.json()
-    for e in summary_data.get('events', []):
+
+def _targetability_items(summary_events):
+    for e in summary_events:
         src = e.get('source')
         tgt = e.get('target')
         if isinstance(src, dict) and src.get('type') == 'NPC': continue
@@ -232,82 +462,82 @@ def get_untargetable_list(fight, config, time_offset):
 
         if 'targetable' in e:
             val = 1 if e['targetable'] == 1 else -1
-            events_list.append({
+            yield {
                 'timestamp': e['timestamp'], 'type': 'targetability', 'val': val,
                 'raw': e, 'targetID': e.get('sourceID', e.get('targetID', 0))
-            })
+            }
 
-    filter_exp = "overkill>0"
-    damage_url = f"{DAMAGE_URL_PREFIX}{config.logs_id}?start={fight.start_time}&end={fight.end_time}&hostility=1&filter={filter_exp}&api_key={config.api_key}{config.translate_param}"
-
-    # 允许这里失败抛出异常
-    resp = requests.get(damage_url, timeout=10)
-    resp.raise_for_status()
-    damage_data = resp.json()
-    for e in damage_data.get('events', []):
-        events_list.append({
+
+def _overkill_items(overkill_events):
+    for e in overkill_events:
+        yield {
             'timestamp': e['timestamp'], 'type': 'overkill', 'val': -1,
             'raw': e, 'targetID': e.get('targetID', 0)
-        })
-
-    events_list.sort(key=lambda x: x['timestamp'])
-
-    unique_events = []
-
-    # 按 targetID 分组
-    events_by_tid = {}
-    for event in events_list:
-        tid = event['targetID']
-        if tid not in events_by_tid:
-            events_by_tid[tid] = []
-        events_by_tid[tid].append(event)
-
-    for tid, group in events_by_tid.items():
-        if not group:
-            continue
-
-        # group 已经是按 timestamp 排序的了
+        }
 
-        # 将连续相同的 val 分为一块 (Chunking)
-        chunks = []
-        current_chunk = [group[0]]
 
-        for i in range(1, len(group)):
-            curr_event = group[i]
-            # 比较当前事件 val 和当前块中事件的 val 是否相同
-            if curr_event['val'] == current_chunk[0]['val']:
-                current_chunk.append(curr_event)
+def _dedup_by_target(items, resolve_window):
+    """
+    按 targetID 将连续相同 val 的事件分为一块，每块只保留一个事件，按时间顺序产出：
+    优先保留 targetability 类型中最早的；全是 overkill 时保留最早的。
+    块内出现 targetability 事件即可定案；只有 overkill 的块在 resolve_window 后按最早事件定案
+    (为 None 时一直等到块结束，与一次性处理完全一致，但死亡单位的块会让后续事件一直缓存)。
+    已定案的块不再保留事件，每个 target 只记两个整数（当前块的 val 与首次出现的顺序）；
+    其余状态只有尚未定案的块和尚未能确定顺序的待产出事件。
+    """
+    tid_order = {}  # 同一时间戳时按 target 首次出现的顺序产出
+    last_val = {}  # tid -> 当前块的 val
+    chunks = {}  # tid -> 尚未定案（只有 overkill）的块的第一个事件，定案后即删除
+    ready = []  # (timestamp, tid_order, seq, item)
+    seq = 0
+
+    def emit(tid, item):
+        nonlocal seq
+        heapq.heappush(ready, (item['timestamp'], tid_order[tid], seq, item))
+        seq += 1
+
+    for item in items:
+        ts = item['timestamp']
+        tid = item['targetID']
+        if tid not in tid_order:
+            tid_order[tid] = len(tid_order)
+
+        if resolve_window is not None:
+            for u_tid, first in list(chunks.items()):
+                if ts - first['timestamp'] > resolve_window:
+                    emit(u_tid, first)
+                    del chunks[u_tid]
+
+        if last_val.get(tid) != item['val']:
+            first = chunks.pop(tid, None)
+            if first is not None:
+                emit(tid, first)
+            last_val[tid] = item['val']
+            if item['type'] == 'targetability':
+                emit(tid, item)
             else:
-                chunks.append(current_chunk)
-                current_chunk = [curr_event]
-        chunks.append(current_chunk)
+                chunks[tid] = item
+        elif tid in chunks and item['type'] == 'targetability':
+            del chunks[tid]
+            emit(tid, item)
 
-        # 在每个块中根据规则选最优事件保留
-        for chunk in chunks:
-            best_event = None
+        # 之后定案的事件时间都不早于 watermark，早于它的事件顺序已确定
+        watermark = min(ts, min((first['timestamp'] for first in chunks.values()), default=ts))
+        while ready and ready[0][0] < watermark:
+            yield heapq.heappop(ready)[3]
 
-            # 筛选出 type 为 targetability 的事件
-            target_candidates = [e for e in chunk if e['type'] == 'targetability']
+    for tid, first in chunks.items():
+        emit(tid, first)
+    while ready:
+        yield heapq.heappop(ready)[3]
 
-            if target_candidates:
-                # 规则A: 优先保留 targetability 类型
-                # 规则B: 如果有多个，保留时间最早的 (由于 chunk 有序，第一个即最早)
-                best_event = target_candidates[0]
-            else:
-                # 规则C: 如果没有 targetability (全是 overkill)，保留时间最早的
-                best_event = chunk[0]
-
-            unique_events.append(best_event)
-
-    # 第四步：将所有 ID 去重后的事件合并，重新按时间排序，供后续计数使用
-    events_list = sorted(unique_events, key=lambda x: x['timestamp'])
 
+def _untargetable_markers(events, fight, time_offset):
     count = 1
     current_zero_start_time = None
     current_zero_start_event = None
-    dead_units = set()
 
-    for event in events_list:
+    for event in events:
         prev_count = count
         count += event['val']
         if count < 0:
@@ -324,7 +554,7 @@ def get_untargetable_list(fight, config, time_offset):
                     m = Marker(current_zero_start_time - time_offset, "Info", duration, "不可选中", "untargetable",
                                current_zero_start_event)
                     m.color = "#b7b7b7"
-                    source.append(m)
+                    yield m
                 current_zero_start_time = None
                 current_zero_start_event = None
 
@@ -334,9 +564,67 @@ def get_untargetable_list(fight, config, time_offset):
             m = Marker(current_zero_start_time - time_offset, "Info", duration, "不可选中", "untargetable",
                        current_zero_start_event)
             m.color = "#b7b7b7"
-            source.append(m)
+            yield m
+
+
+def iter_untargetable_markers(summary_events, overkill_events, fight, time_offset,
+                              resolve_window=UNTARGETABLE_RESOLVE_WINDOW):
+    """
+    流式版本：两路事件各自按时间排序即可，可以是生成器，逐个产出不可选中区间 Marker
+    :param resolve_window: 默认使用 UNTARGETABLE_RESOLVE_WINDOW，内存有界但结果为近似；
+        为 None 时结果精确，但死亡单位的分块会让后续事件一直缓存到战斗结束
+    """
+    # 同一时间戳时 targetability 事件排在 overkill 之前
+    items = heapq.merge(_targetability_items(summary_events), _overkill_items(overkill_events),
+                        key=lambda x: x['timestamp'])
+    return _untargetable_markers(_dedup_by_target(items, resolve_window), fight, time_offset)
+
+
+def process_untargetable_events(summary_events, overkill_events, fight, time_offset):
+    """根据可选中状态与 overkill 事件计算不可选中区间（精确结果，不使用流式模式的定案窗口）"""
+    return list(iter_untargetable_markers(summary_events, overkill_events, fight, time_offset,
+                                          resolve_window=None))
+
+
+def get_untargetable_list(fight, config, time_offset):
+    return process_untargetable_events(iter_summary_events(fight, config), iter_overkill_events(fight, config),
+                                       fight, time_offset)
 
-    return source
+
+def fetch_fight_events(config, session=None):
+    """下载一场战斗后处理所需的全部原始事件，找不到战斗时返回 None"""
+    fight = get_fight_data(config, session)
+    if fight is None:
+        return None
+
+    time_offset = get_real_fight_offset(fight, config, session)
+    cast_events = fetch_cast_events(fight, config, session)
+    summary_events, overkill_events = fetch_untargetable_events(fight, config, session)
+
+    return FightEvents(fight, time_offset, cast_events, summary_events, overkill_events)
+
+
+def build_filter_map(skill_names, saved_skills):
+    """按区域的技能配置生成 filter_map，默认值与配置对话框一致（默认导出、默认不重命名）"""
+    filter_map = {}
+    for skill_name in skill_names:
+        skill_conf = saved_skills.get(skill_name, {})
+        if not skill_conf.get('export', True):
+            continue
+        rename_val = skill_conf.get('rename', skill_name).strip()
+        filter_map[skill_name] = rename_val if rename_val else skill_name
+    return filter_map
+
+
+def build_user_config(all_config, zone_id, skill_names):
+    """不经过配置对话框，直接用已保存的配置生成 generate_final_json 所需的 user_config"""
+    global_settings = all_config.get("GLOBAL_SETTINGS", {})
+    saved_skills = all_config.get(str(zone_id), {}).get('skills', {})
+    return {
+        'min_interval': global_settings.get('min_interval', 3000),
+        'max_tracks': global_settings.get('max_tracks', 20),
+        'filter_map': build_filter_map(skill_names, saved_skills)
+    }
 
 
 def convert_marker_list(marker_list):
@@ -406,21 +694,26 @@ def make_track_list(info_list, min_interval, max_tracks):
 
 
 def fetch_log_data(logs_url, api_key, is_translate):
+    import requests
+
     # 这里进行总的异常捕获，返回给 GUI 显示
     try:
         logs_id, fight_id = parse_url(logs_url)
         config = RuntimeConfig(logs_id, fight_id, api_key, translate=is_translate)
 
         # 这些函数现在会抛出 Exception 而不是打印 error
-        fight = get_fight_data(config)
+        fight_events = fetch_fight_events(config)
 
-        if fight is None:
+        if fight_events is None:
             # 可能是 fight_id 逻辑找不到，或者其他非异常错误
             return None, None, None, "在报告中未找到符合条件的 Fight ID (可能是 last 参数无效，或者 Logs ID 错误)"
 
-        time_offset = get_real_fight_offset(fight, config)
-        cast_list = get_cast_source(fight, config, time_offset)
-        untarget_list = get_untargetable_list(fight, config, time_offset)
+        fight = fight_events.fight
+        time_offset = fight_events.time_offset
+        rules = ConfigManager.get_zone_rules(fight.zone_id)
+        cast_list = process_cast_events(fight_events.cast_events, time_offset, rules)
+        untarget_list = process_untargetable_events(fight_events.summary_events, fight_events.overkill_events,
+                                                    fight, time_offset)
 
         return cast_list, untarget_list, fight, "Success"
 
@@ -442,19 +735,37 @@ def fetch_log_data(logs_url, api_key, is_translate):
         return None, None, None, f"未知错误: {e}"
 
 
-def generate_final_json(cast_list, untarget_list, user_config):
-    # 保持原样，逻辑不需要变
-    min_interval = user_config['min_interval']
-    max_tracks = user_config['max_tracks']
-    filter_map = user_config['filter_map']
+# --- 生成结果缓存 ---
+# 以 (事件数据指纹, 排轨参数, 导出的技能集合) 为键缓存排轨后的 marker；只改重命名时直接改写缓存 marker 的描述，
+# 不重新 make_track_list。缓存的只是 marker，每次调用都从中重新生成一份新的 JSON，调用方可以随意修改返回值
 
-    final_cast_list = []
-    for marker in cast_list:
-        if marker.desc not in filter_map:
-            continue
+MAX_CACHED_LAYOUTS = 8
+
+_layout_cache = OrderedDict()
+_layout_cache_lock = threading.Lock()
 
-        marker.desc = filter_map[marker.desc]
-        final_cast_list.append(marker)
+
+class _LayoutEntry:
+    def __init__(self, laid_out, renames_key):
+        self.laid_out = laid_out  # [(原技能名, 已排轨的 marker 副本)]
+        self.renames_key = renames_key
+
+
+def fingerprint_markers(marker_list):
+    data = repr([(marker.time, marker.duration, marker.desc, marker.source, marker.color, marker.show_text)
+                 for marker in marker_list])
+    return hashlib.blake2b(data.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def clear_layout_cache():
+    with _layout_cache_lock:
+        _layout_cache.clear()
+
+
+def _build_result_json(laid_out, untarget_list, time_range):
+    cast_markers = [marker for _, marker in laid_out]
+    if time_range is not None:
+        return MarkerIndex(cast_markers, untarget_list).export_slice(*time_range)
 
     untargetable_track = {
         "fileType": "MarkerTrackIndividual",
@@ -462,13 +773,58 @@ def generate_final_json(cast_list, untarget_list, user_config):
         "markers": convert_marker_list(untarget_list)
     }
 
-    cast_tracks = make_track_list(final_cast_list, min_interval, max_tracks)
-    final_tracks = [untargetable_track] + cast_tracks
+    # laid_out 已按时间排序，按 track 分组即得到与 make_track_list 相同的结果
+    marker_list_dic = {}
+    for marker in cast_markers:
+        marker_list_dic.setdefault(marker.track, []).append(marker)
+
+    cast_tracks = [{
+        "fileType": "MarkerTrackIndividual",
+        "track": track,
+        "markers": convert_marker_list(marker_list_dic[track])
+    } for track in sorted(marker_list_dic)]
 
-    result_json = {
+    return {
         'fileType': "MarkerTracksCombined",
-        "tracks": final_tracks
+        "tracks": [untargetable_track] + cast_tracks
     }
 
-    return result_json
 
+def generate_final_json(cast_list, untarget_list, user_config):
+    """
+    :param user_config: min_interval / max_tracks / filter_map，
+        可选 time_range=(start_ms, end_ms)：只导出该时间段，并以 start_ms 为新的 0 点
+    """
+    min_interval = user_config['min_interval']
+    max_tracks = user_config['max_tracks']
+    filter_map = user_config['filter_map']
+    time_range = user_config.get('time_range')
+
+    layout_key = (fingerprint_markers(cast_list), fingerprint_markers(untarget_list),
+                  min_interval, max_tracks, frozenset(filter_map))
+    renames_key = frozenset(filter_map.items())
+
+    with _layout_cache_lock:
+        entry = _layout_cache.get(layout_key)
+
+        if entry is None:
+            # 重命名时复制 marker，不修改传入的 cast_list，便于用不同配置重复生成
+            laid_out = [(marker.desc, marker.copy(desc=filter_map[marker.desc]))
+                        for marker in cast_list if marker.desc in filter_map]
+            laid_out.sort(key=lambda x: x[1].time)
+            # 先对整场战斗排轨，再按需切片，保证切片与完整时间轴的轨道一致
+            make_track_list([marker for _, marker in laid_out], min_interval, max_tracks)
+
+            entry = _LayoutEntry(laid_out, renames_key)
+            _layout_cache[layout_key] = entry
+            while len(_layout_cache) > MAX_CACHED_LAYOUTS:
+                _layout_cache.popitem(last=False)
+        elif entry.renames_key != renames_key:
+            for original_desc, marker in entry.laid_out:
+                marker.desc = filter_map[original_desc]
+            entry.renames_key = renames_key
+
+        _layout_cache.move_to_end(layout_key)
+
+        # 在锁内生成，避免其他线程同时改写缓存 marker 的描述
+        return _build_result_json(entry.laid_out, untarget_list, time_range)